@@ -1,49 +1,108 @@
 # ConnectDatabase file
 import duckdb
+import hashlib
 import os
 from contextlib import contextmanager
 import logging
 
+def _configure(conn, read_only=False):
+    """Apply session settings that let DuckDB use its parallel paths"""
+    conn.execute(f"SET threads TO {os.cpu_count() or 1}")
+    conn.execute("SET memory_limit='4GB'")
+    conn.execute("SET preserve_insertion_order=false")
+    if read_only:
+        conn.execute("SET enable_object_cache=true")
+    return conn
+
 def connect():
     """Establish connection to the database"""
-    conn = duckdb.connect('my_database.db', read_only=True)
+    conn = _configure(duckdb.connect('my_database.db', read_only=True), read_only=True)
     print("Connected to the database")
     return conn
 def connect_payments():
     """Establish connection to the database"""
-    conn = duckdb.connect('payments.db', read_only=True)
+    conn = _configure(duckdb.connect('payments.db', read_only=True), read_only=True)
     print("Connected to the database")
     return conn
 
 def connect_write():
     """Establish connection to the database"""
-    conn = duckdb.connect('my_database.db', read_only=False)
+    conn = _configure(duckdb.connect('my_database.db', read_only=False))
     print("Connected to the database")
     return conn
 def connect_write_payments():
     """Establish connection to the database"""
-    conn = duckdb.connect('payments.db', read_only=False)
+    conn = _configure(duckdb.connect('payments.db', read_only=False))
     print("Connected to the database")
     return conn
 
-def reset(conn,file_path,table_name):
-    """Drop all tables using existing connection"""
+META_TABLE = '_meta'
+
+def source_signature(file_path,schema=None,derived_columns=None,date_format=None):
+    """Cheap signature of a load: the source file's size and modification time
+    plus a digest of the options that shape the loaded table"""
+    # schema order is kept as given, since COPY maps CSV fields by position
+    options = repr((list((schema or {}).items()),
+                    sorted((derived_columns or {}).items()),
+                    date_format))
+    digest = hashlib.sha256(options.encode()).hexdigest()[:16]
+    return f"{os.path.getsize(file_path)}:{int(os.path.getmtime(file_path))}:{digest}"
+
+def invalidate(conn,table_name):
+    """Forget the stored signature of table_name so the next reset reloads it"""
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {META_TABLE} (key TEXT PRIMARY KEY, value TEXT)")
+    conn.execute(f"DELETE FROM {META_TABLE} WHERE key = ?", [table_name])
+
+def reset(conn,file_path,table_name,schema=None,derived_columns=None,date_format=None):
+    """Drop all tables and load file_path into table_name.
+
+    If schema ({column: type}) is given the table is created up front and
+    filled with COPY, skipping the CSV sniffer; date_format (e.g. '%m/%d/%Y')
+    tells COPY how DATE columns are written in the file. derived_columns
+    ({column: (type, expression)}) are added and computed once after the
+    load so queries can read them instead of recomputing them. Nothing is
+    reloaded when the signature of file_path and these load options matches
+    the one stored at the last load and the table has not been modified
+    since (see invalidate).
+    """
     try:
-        # Get list of all tables
-        tables = conn.sql("SHOW TABLES").fetchall()
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {META_TABLE} (key TEXT PRIMARY KEY, value TEXT)")
+        signature = source_signature(file_path, schema, derived_columns, date_format)
+        stored = conn.execute(f"SELECT value FROM {META_TABLE} WHERE key = ?",
+                              [table_name]).fetchone()
+        tables = [table[0] for table in conn.sql("SHOW TABLES").fetchall()]
+        if stored and stored[0] == signature and table_name in tables:
+            print(f"{file_path} is unchanged, keeping table {table_name}")
+            return
 
         # Drop each table
         for table in tables:
-            table_name = table[0]
-            conn.sql(f"DROP TABLE IF EXISTS {table_name}")
+            if table == META_TABLE:
+                continue
+            conn.sql(f"DROP TABLE IF EXISTS {table}")
             logging.info(f"Dropped table: {table}")
         print("All tables have been dropped successfully")
 
         # Import CSV file into new table
-        conn.sql(f"""
-            CREATE TABLE {table_name} AS 
-            SELECT * FROM read_csv_auto({file_path})
-        """)
+        if schema:
+            columns = ", ".join(f'"{col}" {col_type}' for col, col_type in schema.items())
+            conn.execute(f"CREATE TABLE {table_name} ({columns})")
+            # COPY does not accept a bound parameter for the path, so escape it
+            path = file_path.replace("'", "''")
+            options = "FORMAT CSV, HEADER TRUE, PARALLEL TRUE"
+            if date_format:
+                options += ", DATEFORMAT '" + date_format.replace("'", "''") + "'"
+            conn.execute(f"COPY {table_name} FROM '{path}' ({options})")
+        else:
+            conn.execute(f"""
+                CREATE TABLE {table_name} AS 
+                SELECT * FROM read_csv_auto(?)
+            """, [file_path])
+        for col, (col_type, expression) in (derived_columns or {}).items():
+            conn.execute(f'ALTER TABLE {table_name} ADD COLUMN "{col}" {col_type}')
+            conn.execute(f'UPDATE {table_name} SET "{col}" = {expression}')
+        conn.execute(f"INSERT OR REPLACE INTO {META_TABLE} VALUES (?, ?)",
+                     [table_name, signature])
         print(f"Successfully imported {file_path} into table {table_name}")
 
         print("\nFirst 5 rows of the sales table:")
@@ -2,20 +2,54 @@ import pandas as pd
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from reportlab.platypus import SimpleDocTemplate, Table, LongTable, TableStyle, Paragraph, Spacer
 from reportlab.lib.units import inch
-from typing import Dict, List
+from typing import Dict, Iterable, List
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+_STYLES = getSampleStyleSheet()
+
+_TITLE_STYLE = ParagraphStyle(
+    'CustomTitle',
+    parent=_STYLES['Heading1'],
+    fontSize=24,
+    spaceAfter=30
+)
+
+_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 14),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 1), (-1, -1), 12),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ('TOPPADDING', (0, 1), (-1, -1), 8),
+    ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
+])
+
 class ReportGenerator:
     def __init__(self, report_data: Dict):
         """Initialize with the quality check report data."""
         self.report_data = report_data
         self.timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
 
-    def generate_csv_reports(self, output_dir: str = 'reports'):
-        """Generate CSV reports for each aspect of the data quality check."""
+    def generate_csv_reports(self, output_dir: str = 'reports', conn=None,
+                             queries: Dict[str, str] = None, file_format: str = 'csv'):
+        """Generate CSV reports for each aspect of the data quality check.
+
+        If conn and queries (e.g. DataQualityChecker.consistency_queries()) are
+        given, consistency results are written straight from DuckDB with
+        COPY ... TO, as CSV or, with file_format='parquet', as ZSTD-compressed
+        Parquet, instead of from the rows held in the report.
+        """
         os.makedirs(output_dir, exist_ok=True)
         base_filename = f"{output_dir}/quality_report_{self.timestamp}"
 
@@ -38,12 +72,17 @@ class ReportGenerator:
         categorical_df.to_csv(f"{base_filename}_categorical_values.csv", index=False)
 
         # Consistency checks report
-        for check_name, issues in self.report_data['consistency_checks'].items():
-            if issues:
-                pd.DataFrame(issues).to_csv(
-                    f"{base_filename}_consistency_{check_name}.csv",
-                    index=False
-                )
+        if conn is not None and queries:
+            for check_name, query in queries.items():
+                self._copy_query(conn, query,
+                                 f"{base_filename}_consistency_{check_name}", file_format)
+        else:
+            for check_name, issues in self.report_data['consistency_checks'].items():
+                if issues:
+                    pd.DataFrame(issues).to_csv(
+                        f"{base_filename}_consistency_{check_name}.csv",
+                        index=False
+                    )
 
         # Summary statistics
         pd.DataFrame([self.report_data['summary_statistics']]).to_csv(
@@ -51,39 +90,71 @@ class ReportGenerator:
 
         return base_filename
 
+    @staticmethod
+    def _copy_query(conn, query: str, base_path: str, file_format: str = 'csv'):
+        """Write the result of query to base_path.<file_format> with DuckDB's COPY.
+
+        Returns the path written, or None when the query had no rows, in which
+        case no file is left behind.
+        """
+        if file_format == 'parquet':
+            path, options = f"{base_path}.parquet", "FORMAT PARQUET, COMPRESSION ZSTD"
+        elif file_format == 'csv':
+            path, options = f"{base_path}.csv", "FORMAT CSV, HEADER"
+        else:
+            raise ValueError(f"Unsupported file_format: {file_format!r}")
+        escaped = path.replace("'", "''")
+        written = conn.execute(f"COPY ({query}) TO '{escaped}' ({options})").fetchone()[0]
+        if not written:
+            os.remove(path)
+            return None
+        return path
+
     def generate_pdf_report(self, output_dir: str = 'reports'):
         """Generate a comprehensive PDF report."""
         os.makedirs(output_dir, exist_ok=True)
         filename = f"{output_dir}/quality_report_{self.timestamp}.pdf"
-        doc = SimpleDocTemplate(filename, pagesize=letter)
-        styles = getSampleStyleSheet()
-        elements = []
 
-        # Title
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=24,
-            spaceAfter=30
-        )
-        elements.append(Paragraph("Data Quality Report", title_style))
-        elements.append(Paragraph(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
-                                styles['Normal']))
-        elements.append(Spacer(1, 20))
+        # Sections are independent, so build their flowables concurrently;
+        # map() keeps them in report order
+        builders = [
+            self._build_title_section,
+            self._build_summary_section,
+            self._build_missing_section,
+            self._build_ranges_section,
+            self._build_categorical_section,
+            self._build_consistency_section
+        ]
+        with ThreadPoolExecutor(max_workers=min(len(builders), os.cpu_count() or 1)) as executor:
+            sections = list(executor.map(lambda build: build(), builders))
+        elements = [element for section in sections for element in section]
 
-        # Summary Statistics
-        elements.append(Paragraph("Summary Statistics", styles['Heading2']))
+        # Build PDF
+        self._build_pdf(filename, elements)
+        return filename
+
+    def _build_title_section(self) -> list:
+        return [
+            Paragraph("Data Quality Report", _TITLE_STYLE),
+            Paragraph(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+                      _STYLES['Normal']),
+            Spacer(1, 20)
+        ]
+
+    def _build_summary_section(self) -> list:
+        elements = [Paragraph("Summary Statistics", _STYLES['Heading2'])]
         summary_data = [[k, str(v)] for k, v in self.report_data['summary_statistics'].items()]
         summary_table = Table(
             [['Metric', 'Value']] + summary_data,
             colWidths=[4*inch, 3*inch]
         )
-        summary_table.setStyle(self._get_table_style())
+        summary_table.setStyle(_TABLE_STYLE)
         elements.append(summary_table)
         elements.append(Spacer(1, 20))
+        return elements
 
-        # Missing Values
-        elements.append(Paragraph("Missing Values Analysis", styles['Heading2']))
+    def _build_missing_section(self) -> list:
+        elements = [Paragraph("Missing Values Analysis", _STYLES['Heading2'])]
         missing_data = [[k, str(v)] for k, v in self.report_data['missing_values'].items()
                        if v > 0]
         if missing_data:
@@ -91,102 +162,105 @@ class ReportGenerator:
                 [['Column', 'Missing Count']] + missing_data,
                 colWidths=[4*inch, 3*inch]
             )
-            missing_table.setStyle(self._get_table_style())
+            missing_table.setStyle(_TABLE_STYLE)
             elements.append(missing_table)
         else:
-            elements.append(Paragraph("No missing values found.", styles['Normal']))
+            elements.append(Paragraph("No missing values found.", _STYLES['Normal']))
         elements.append(Spacer(1, 20))
+        return elements
+
+    def _build_ranges_section(self) -> list:
+        elements = [Paragraph("Numeric Range Violations", _STYLES['Heading2'])]
+        violations = {col: stats for col, stats in self.report_data['numeric_ranges'].items()
+                      if stats['outlier_count'] > 0}
+        if not violations:
+            elements.append(Paragraph("No numeric range violations found.", _STYLES['Normal']))
+            elements.append(Spacer(1, 20))
+            return elements
 
-        # Numeric Range Violations
-        elements.append(Paragraph("Numeric Range Violations", styles['Heading2']))
-        for col, stats in self.report_data['numeric_ranges'].items():
-            if stats['outlier_count'] > 0:
-                elements.append(Paragraph(f"Column: {col}", styles['Heading3']))
-                range_data = [[k, str(v)] for k, v in stats.items()]
-                range_table = Table(
-                    [['Metric', 'Value']] + range_data,
-                    colWidths=[4*inch, 3*inch]
-                )
-                range_table.setStyle(self._get_table_style())
-                elements.append(range_table)
-                elements.append(Spacer(1, 10))
+        for col, stats in violations.items():
+            elements.append(Paragraph(f"Column: {col}", _STYLES['Heading3']))
+            range_data = [[k, str(v)] for k, v in stats.items()]
+            range_table = Table(
+                [['Metric', 'Value']] + range_data,
+                colWidths=[4*inch, 3*inch]
+            )
+            range_table.setStyle(_TABLE_STYLE)
+            elements.append(range_table)
+            elements.append(Spacer(1, 10))
         elements.append(Spacer(1, 10))
+        return elements
 
-        # Categorical Value Violations
-        elements.append(Paragraph("Categorical Value Violations", styles['Heading2']))
-        cat_violations = False
-        for col, invalid_values in self.report_data['categorical_values'].items():
-            if invalid_values:
-                cat_violations = True
-                elements.append(Paragraph(
-                    f"Column: {col}\nInvalid Values: {', '.join(map(str, invalid_values))}",
-                    styles['Normal']
-                ))
-                elements.append(Spacer(1, 10))
-        if not cat_violations:
+    def _build_categorical_section(self) -> list:
+        elements = [Paragraph("Categorical Value Violations", _STYLES['Heading2'])]
+        violations = {col: values for col, values in self.report_data['categorical_values'].items()
+                      if values}
+        if not violations:
             elements.append(Paragraph("No categorical value violations found.",
-                                   styles['Normal']))
+                                   _STYLES['Normal']))
+        for col, invalid_values in violations.items():
+            elements.append(Paragraph(
+                f"Column: {col}\nInvalid Values: {', '.join(map(str, invalid_values))}",
+                _STYLES['Normal']
+            ))
+            elements.append(Spacer(1, 10))
         elements.append(Spacer(1, 20))
+        return elements
 
-        # Consistency Checks
-        elements.append(Paragraph("Data Consistency Issues", styles['Heading2']))
-        for check_name, issues in self.report_data['consistency_checks'].items():
-            if issues:
-                elements.append(Paragraph(f"{check_name}", styles['Heading3']))
-                if issues:
-                    # Get columns from first record
-                    columns = list(issues[0].keys())
-                    # Create table with all records
-                    table_data = [columns]  # Header row
-                    for issue in issues:
-                        table_data.append([str(issue[col]) for col in columns])
-
-                    table = Table(table_data, colWidths=[2 * inch] * len(columns))
-                    table.setStyle(self._get_table_style())
-                    elements.append(table)
-                elements.append(Spacer(1, 10))
-            else:
-                elements.append(Paragraph(f"No issues found for {check_name}", styles['Normal']))
+    def _build_consistency_section(self) -> list:
+        elements = [Paragraph("Data Consistency Issues", _STYLES['Heading2'])]
+        failed = {check_name: issues
+                  for check_name, issues in self.report_data['consistency_checks'].items()
+                  if issues}
+        if not failed:
+            elements.append(Paragraph("All consistency checks passed.", _STYLES['Normal']))
+            return elements
 
-        # Build PDF
-        doc.build(elements)
-        return filename
+        for check_name in self.report_data['consistency_checks']:
+            issues = failed.get(check_name)
+            if not issues:
+                elements.append(Paragraph(f"No issues found for {check_name}", _STYLES['Normal']))
+                continue
+            elements.append(Paragraph(f"{check_name}", _STYLES['Heading3']))
+            table = self._build_table(issues, 2 * inch)
+            elements.append(table)
+            elements.append(Spacer(1, 10))
+        return elements
 
-    def _get_table_style(self):
-        """Return a consistent table style for the report."""
-        return TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 14),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, -1), 12),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('TOPPADDING', (0, 1), (-1, -1), 8),
-            ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
-        ])
+    @staticmethod
+    def _build_pdf(filename: str, elements: list):
+        """Build elements into filename through a large-buffered temporary file."""
+        tmp = filename + '.part'
+        try:
+            with open(tmp, 'wb', buffering=1 << 20) as f:
+                SimpleDocTemplate(f, pagesize=letter).build(elements)
+            # Only replace the report once it has been written completely
+            os.replace(tmp, filename)
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    @staticmethod
+    def _build_table(records: List[Dict], col_width: float) -> LongTable:
+        """Build a styled LongTable of records that repeats its header on every page."""
+        # Get columns from first record
+        columns = list(records[0].keys())
+        rows = [[str(record[col]) for col in columns] for record in records]
+        table = LongTable([columns] + rows, colWidths=[col_width] * len(columns),
+                          repeatRows=1, splitByRow=1)
+        table.setStyle(_TABLE_STYLE)
+        return table
 
     def generate_payment_report(self, discrepancies: Dict, output_dir: str = 'reports'):
 
         os.makedirs(output_dir, exist_ok=True)
         filename = f"{output_dir}/payment_discrepancies_{self.timestamp}.pdf"
-        doc = SimpleDocTemplate(filename, pagesize=letter)
-        styles = getSampleStyleSheet()
+        styles = _STYLES
         elements = []
 
         # Title
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=24,
-            spaceAfter=30
-        )
-        elements.append(Paragraph("Payment Discrepancy Report", title_style))
+        elements.append(Paragraph("Payment Discrepancy Report", _TITLE_STYLE))
         elements.append(Paragraph(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
                                   styles['Normal']))
         elements.append(Spacer(1, 20))
@@ -194,16 +268,7 @@ class ReportGenerator:
         # Amount Mismatches Table
         elements.append(Paragraph("Amount Mismatches", styles['Heading2']))
         if discrepancies['amount_mismatch']:
-            # Get all column names from first record
-            columns = list(discrepancies['amount_mismatch'][0].keys())
-            # Create header row
-            table_data = [columns]
-            # Add all records
-            for record in discrepancies['amount_mismatch']:
-                table_data.append([str(record[col]) for col in columns])
-
-            table = Table(table_data, colWidths=[2 * inch] * len(columns))
-            table.setStyle(self._get_table_style())
+            table = self._build_table(discrepancies['amount_mismatch'], 2 * inch)
             elements.append(table)
         else:
             elements.append(Paragraph("No amount mismatches found.", styles['Normal']))
@@ -212,47 +277,61 @@ class ReportGenerator:
         # Duplicate Payments Table
         elements.append(Paragraph("Duplicate Payments", styles['Heading2']))
         if discrepancies['duplicate_payments']:
-            # Get columns from first record
-            columns = list(discrepancies['duplicate_payments'][0].keys())
-            # Create header row
-            table_data = [columns]
-            # Add all records
-            for record in discrepancies['duplicate_payments']:
-                table_data.append([str(record[col]) for col in columns])
-
-            table = Table(table_data, colWidths=[3 * inch] * len(columns))
-            table.setStyle(self._get_table_style())
+            table = self._build_table(discrepancies['duplicate_payments'], 3 * inch)
             elements.append(table)
         else:
             elements.append(Paragraph("No duplicate payments found.", styles['Normal']))
 
         # Build PDF
-        doc.build(elements)
+        self._build_pdf(filename, elements)
         return filename
 
-    def export_report_to_excel(report: Dict, filename: str = 'data_quality_report.xlsx'):
-        with pd.ExcelWriter(filename, engine='xlsxwriter') as writer:
+    def export_report_to_excel(self, report: Dict, filename: str = 'data_quality_report.xlsx'):
+        # constant_memory flushes each row as it is written, so every sheet
+        # has to be written row by row rather than through DataFrame.to_excel
+        options = {
+            'constant_memory': True,
+            'strings_to_urls': False,
+            'nan_inf_to_errors': True,
+            'default_date_format': 'yyyy-mm-dd'
+        }
+        with pd.ExcelWriter(filename, engine='xlsxwriter',
+                            engine_kwargs={'options': options}) as writer:
             # Missing values
-            pd.DataFrame([report['missing_values']]).to_excel(
-                writer, sheet_name='Missing Values', index=False)
+            missing = report['missing_values']
+            self._write_sheet(writer, 'Missing Values', list(missing), [list(missing.values())])
 
             # Numeric ranges - show all stats
-            numeric_ranges_df = pd.DataFrame(report['numeric_ranges']).T
-            numeric_ranges_df.to_excel(writer, sheet_name='Numeric Ranges')
+            numeric_ranges = report['numeric_ranges']
+            stat_names = list(next(iter(numeric_ranges.values()), {}))
+            self._write_sheet(writer, 'Numeric Ranges', [''] + stat_names, (
+                [col] + [stats[name] for name in stat_names]
+                for col, stats in numeric_ranges.items()
+            ))
 
             # Categorical values - show all violations
-            categorical_df = pd.DataFrame([
-                {'Column': col, 'Invalid Values': ', '.join(map(str, values))}
+            self._write_sheet(writer, 'Categorical Values', ['Column', 'Invalid Values'], (
+                [col, ', '.join(map(str, values))]
                 for col, values in report['categorical_values'].items()
-            ])
-            categorical_df.to_excel(writer, sheet_name='Categorical Values', index=False)
+            ))
 
             # Consistency checks - all records for each type of check
             for check_name, results in report['consistency_checks'].items():
                 if results:
-                    df = pd.DataFrame(results)
-                    df.to_excel(writer, sheet_name=f'Consistency_{check_name}', index=False)
+                    columns = list(results[0].keys())
+                    self._write_sheet(writer, f'Consistency_{check_name}', columns, (
+                        [record[col] for col in columns] for record in results
+                    ))
 
             # Summary statistics
-            pd.DataFrame([report['summary_statistics']]).to_excel(
-                writer, sheet_name='Summary Statistics', index=False)
+            summary = report['summary_statistics']
+            self._write_sheet(writer, 'Summary Statistics', list(summary), [list(summary.values())])
+
+    @staticmethod
+    def _write_sheet(writer: pd.ExcelWriter, sheet_name: str, columns: List[str],
+                     rows: Iterable[List]):
+        """Write a header row followed by rows, in order, to a new worksheet."""
+        worksheet = writer.book.add_worksheet(sheet_name)
+        worksheet.write_row(0, 0, columns)
+        for row_idx, row in enumerate(rows, start=1):
+            worksheet.write_row(row_idx, 0, row)
@@ -1,13 +1,61 @@
 from ReportGen import ReportGenerator
 import ConnectDatabase as db
-import pandas as pd
 from datetime import datetime
 import logging
 from typing import Dict, List, Any
+# Check results are fetched as Arrow tables (to_arrow_table), which needs
+# duckdb >= 1.5 and pyarrow installed alongside it
 import duckdb
-from concurrent.futures import ThreadPoolExecutor
-from multiprocessing import Pool, cpu_count
-from concurrent.futures import ThreadPoolExecutor
+
+SALES_SCHEMA = {
+    'Invoice_ID': 'VARCHAR',
+    'Branch': 'VARCHAR',
+    'City': 'VARCHAR',
+    'Customer_type': 'VARCHAR',
+    'Gender': 'VARCHAR',
+    'Product_line': 'VARCHAR',
+    'Unit_price': 'DOUBLE',
+    'Quantity': 'BIGINT',
+    'Tax_5pct': 'DOUBLE',
+    'Total': 'DOUBLE',
+    'Date': 'DATE',
+    'Time': 'TIME',
+    'Payment': 'VARCHAR',
+    'cogs': 'DOUBLE',
+    'gross_margin_pct': 'DOUBLE',
+    'gross_income': 'DOUBLE',
+    'Rating': 'DOUBLE'
+}
+
+SALES_DATE_FORMAT = '%m/%d/%Y'
+
+SALES_DERIVED_COLUMNS = {
+    'calculated_total': ('DOUBLE', '"Unit_price" * Quantity * (1 + 0.05)')
+}
+
+SUMMARY_COLUMNS = ('total_records', 'unique_invoices', 'unique_products',
+                   'avg_rating', 'avg_margin')
+
+# Consistency checks: the columns reported for each failing row (name -> SQL
+# expression) and the condition a row fails on
+CONSISTENCY_CHECKS = {
+    'total_calculation': {
+        'columns': {
+            'Invoice_ID': '"Invoice_ID"',
+            'Total': 'Total',
+            'calculated_total': 'calculated_total',
+            'difference': 'ABS(Total - calculated_total)'
+        },
+        'condition': 'ABS(Total - calculated_total) > 0.01'
+    },
+    'future_dates': {
+        'columns': {
+            'Invoice_ID': '"Invoice_ID"',
+            'Date': 'Date'
+        },
+        'condition': 'Date > CURRENT_DATE'
+    }
+}
 
 class DataQualityChecker:
     def __init__(self, conn: duckdb.DuckDBPyConnection):
@@ -27,6 +75,63 @@ class DataQualityChecker:
                 'Payment': ['Cash', 'Credit card', 'Ewallet']
             }
         }
+        self.columns = [col[1] for col in conn.execute("PRAGMA table_info('sales')").fetchall()]
+        self._queries = self._build_queries()
+
+    def _build_queries(self) -> Dict[str, Any]:
+        """Build the check SQL once, after validating rule columns against sales."""
+        rule_columns = set(self.rules['numeric_ranges']) | set(self.rules['categorical_values'])
+        unknown = rule_columns - set(self.columns)
+        if unknown:
+            raise ValueError(f"Columns not found in sales: {', '.join(sorted(unknown))}")
+
+        # One scan over sales for every column instead of one query per column
+        self.missing_columns = [col for col in self.columns if col not in SALES_DERIVED_COLUMNS]
+        missing = ", ".join(f'COUNT(*) - COUNT("{col}") AS "{col}"' for col in self.missing_columns)
+
+        range_exprs = []
+        for col, (min_val, max_val) in self.rules['numeric_ranges'].items():
+            outlier = f'"{col}" < {min_val} OR "{col}" > {max_val}'
+            range_exprs.append(f"""
+                COUNT(*) FILTER (WHERE {outlier}),
+                MIN("{col}") FILTER (WHERE {outlier}),
+                MAX("{col}") FILTER (WHERE {outlier})""")
+
+        subqueries = []
+        for column, valid_values in self.rules['categorical_values'].items():
+            values_str = ", ".join("'" + str(v).replace("'", "''") + "'" for v in valid_values)
+            subqueries.append(f"""
+           SELECT '{column}' AS c, CAST("{column}" AS VARCHAR) AS v
+           FROM sales
+           WHERE "{column}" NOT IN ({values_str})
+           GROUP BY "{column}"
+           """)
+
+        # One query per consistency check, for exporting each result directly
+        consistency_checks = {}
+        for check_name, check in CONSISTENCY_CHECKS.items():
+            columns = ", ".join(f'{expr} AS "{col}"' for col, expr in check['columns'].items())
+            consistency_checks[check_name] = \
+                f"SELECT {columns} FROM sales WHERE {check['condition']}"
+
+        # Every consistency check in one scan; a flag per check marks which
+        # checks each returned row fails
+        all_columns = {}
+        for check in CONSISTENCY_CHECKS.values():
+            all_columns.update(check['columns'])
+        select = [f'{expr} AS "{col}"' for col, expr in all_columns.items()]
+        select += [f'({check["condition"]}) AS "{check_name}"'
+                   for check_name, check in CONSISTENCY_CHECKS.items()]
+        where = " OR ".join(f"({check['condition']})" for check in CONSISTENCY_CHECKS.values())
+        consistency = f"SELECT {', '.join(select)} FROM sales WHERE {where}"
+
+        return {
+            'missing': f"SELECT {missing} FROM sales",
+            'numeric_ranges': f"SELECT {','.join(range_exprs)} FROM sales",
+            'categorical': " UNION ALL ".join(subqueries),
+            'consistency': consistency,
+            'consistency_checks': consistency_checks
+        }
 
     def setup_logging(self):
         logging.basicConfig(level=logging.INFO,
@@ -35,75 +140,59 @@ class DataQualityChecker:
 
 
     def check_single_column(self, column: str) -> tuple:
-        aconn=duckdb.connect("my_database.db", read_only=True)
+        if column not in self.columns:
+            self.logger.error(f"Error checking column {column}: not a column of sales")
+            return (column, 0)
         try:
-            query = f"SELECT CAST(COUNT(*) - COUNT({column}) AS INTEGER) FROM sales"
-            result = aconn.execute(query).fetchone()
+            query = f'SELECT CAST(COUNT(*) - COUNT("{column}") AS INTEGER) FROM sales'
+            result = self.conn.execute(query).fetchone()
             return (column, result[0] if result else 0)
         except Exception as e:
             self.logger.error(f"Error checking column {column}: {e}")
             return (column, 0)
 
     def check_missing_values(self) -> Dict[str, int]:
-        aconn = duckdb.connect("my_database.db", read_only=True)
-        columns = aconn.execute("SELECT * FROM sales LIMIT 0").description
-        column_names = [desc[0] for desc in columns]
-
-        with ThreadPoolExecutor() as executor:
-            args = [(db.connect(), col) for col in column_names]
-            results = executor.map(check_column_missing, args)
-
-        return dict(results)
+        row = self.conn.execute(self._queries['missing']).fetchone()
+        return dict(zip(self.missing_columns, row))
 
 
     def check_numeric_ranges(self) -> Dict[str, Dict]:
-        db_path = 'my_database.db'
-        args = [(db_path, col, range_[0], range_[1])
-                for col, range_ in self.rules['numeric_ranges'].items()]
-
-        with Pool(processes=cpu_count()) as pool:
-            results = pool.map(check_column_range, args)
+        row = self.conn.execute(self._queries['numeric_ranges']).fetchone()
 
-        return dict(results)
+        results = {}
+        for i, col in enumerate(self.rules['numeric_ranges']):
+            outlier_count, min_value, max_value = row[3 * i:3 * i + 3]
+            results[col] = {
+                'outlier_count': outlier_count,
+                'min_value': min_value,
+                'max_value': max_value
+            }
+        return results
 
     def check_categorical_values(self) -> Dict[str, List[str]]:
-        aconn=duckdb.connect("my_database.db", read_only=True)
-        results = {}
-        for column, valid_values in self.rules['categorical_values'].items():
-            values_str = ", ".join([f"'{v}'" for v in valid_values])
-            query = f"""
-           SELECT DISTINCT {column}
-           FROM sales
-           WHERE {column} NOT IN ({values_str})
-           """
-            result = aconn.execute(query).fetchdf()
-            results[column] = result[column].tolist() if not result.empty else []
+        rows = self.conn.execute(self._queries['categorical']).fetchall()
+
+        results = {column: [] for column in self.rules['categorical_values']}
+        for column, value in rows:
+            results[column].append(value)
         return results
 
+    def consistency_queries(self) -> Dict[str, str]:
+        """SQL for each consistency check, for callers that export results directly."""
+        return dict(self._queries['consistency_checks'])
+
     def check_data_consistency(self) -> Dict[str, List[Dict]]:
-        aconn = duckdb.connect("my_database.db", read_only=True)
-        consistency_checks = {
-            'total_calculation': """
-               SELECT "Invoice_ID", Total,
-                      ("Unit_price" * Quantity * (1 + 0.05)) as calculated_total,
-                      ABS(Total - ("Unit_price" * Quantity * (1 + 0.05))) as difference
-               FROM sales
-               WHERE ABS(Total - ("Unit_price" * Quantity * (1 + 0.05))) > 0.01
-           """,
-            'future_dates': """
-               SELECT "Invoice_ID", Date
-               FROM sales
-               WHERE Date > CURRENT_DATE
-           """
-        }
+        rows = self.conn.execute(self._queries['consistency']).to_arrow_table().to_pylist()
 
-        results = {}
-        for check_name, query in consistency_checks.items():
-            result = aconn.execute(query).fetchdf()
-            results[check_name] = result.to_dict('records')
+        results = {check_name: [] for check_name in CONSISTENCY_CHECKS}
+        for row in rows:
+            for check_name, check in CONSISTENCY_CHECKS.items():
+                if row[check_name]:
+                    results[check_name].append({col: row[col] for col in check['columns']})
         return results
 
-    def generate_quality_report_(self) -> Dict:
+    def generate_quality_report(self) -> Dict:
+        # Each check is a single query on self.conn, so run them in sequence
         report = {
             'missing_values': self.check_missing_values(),
             'numeric_ranges': self.check_numeric_ranges(),
@@ -111,129 +200,69 @@ class DataQualityChecker:
             'consistency_checks': self.check_data_consistency()
         }
 
-        summary_query = """
-       SELECT
-           COUNT(*) as total_records,
-           COUNT(DISTINCT "Invoice_ID") as unique_invoices,
-           COUNT(DISTINCT "Product_line") as unique_products,
-           AVG(Rating) as avg_rating,
-           AVG("gross_margin_pct") as avg_margin
-       FROM sales
-       """
-        summary = self.conn.execute(summary_query).fetchdf()
-        report['summary_statistics'] = summary.to_dict('records')[0]
+        report['summary_statistics'] = self.get_summary_statistics()
         return report
 
-    def generate_quality_report(self) -> Dict:
-        with ThreadPoolExecutor() as executor:
-            # Use existing class connection for checks
-            futures = {
-                'missing_values': executor.submit(lambda: self.check_missing_values()),
-                'numeric_ranges': executor.submit(lambda: self.check_numeric_ranges()),
-                'categorical_values': executor.submit(lambda: self.check_categorical_values()),
-                'consistency_checks': executor.submit(lambda: self.check_data_consistency())
-            }
-
-            # Use same connection for summary
-            def get_summary():
-                query = """
-                SELECT 
-                    COUNT(*) as total_records,
-                    COUNT(DISTINCT "Invoice_ID") as unique_invoices,
-                    COUNT(DISTINCT "Product_line") as unique_products,
-                    AVG(Rating) as avg_rating,
-                    AVG("gross_margin_pct") as avg_margin
-                FROM sales
-                """
-                result = self.conn.execute(query).fetchdf()
-                records = result.to_dict('records')
-                return records[0] if records else {
-                    'total_records': 0,
-                    'unique_invoices': 0,
-                    'unique_products': 0,
-                    'avg_rating': 0,
-                    'avg_margin': 0
-                }
-
-            summary_future = executor.submit(get_summary)
-
-            # Collect results
-            report = {key: future.result() for key, future in futures.items()}
-            report['summary_statistics'] = summary_future.result()
-
-        return report
+    def get_summary_statistics(self) -> Dict:
+        query = """
+        SELECT 
+            COUNT(*) as total_records,
+            COUNT(DISTINCT "Invoice_ID") as unique_invoices,
+            COUNT(DISTINCT "Product_line") as unique_products,
+            AVG(Rating) as avg_rating,
+            AVG("gross_margin_pct") as avg_margin
+        FROM sales
+        """
+        row = self.conn.execute(query).fetchone()
+        return dict(zip(SUMMARY_COLUMNS, row))
 
 def auto_correct_data(conn: duckdb.DuckDBPyConnection) -> Dict[str, int]:
+    """Fix whitespace and casing in sales in place.
 
+    When any row is corrected, the stored load signature of sales is
+    invalidated so the next run reloads the raw CSV. As long as the source
+    file itself needs corrections, sales is therefore reloaded on every run.
+    """
+    # Trimming and case fixes in one UPDATE so sales is rewritten only once,
+    # and only for rows that one of the corrections actually changes
     corrections = {
-        'trim_whitespace': """
-           UPDATE sales 
-           SET 
-               "Invoice_ID" = TRIM("Invoice_ID"),
-               Branch = TRIM(Branch),
-               City = TRIM(City),
-               "Customer_type" = TRIM("Customer_type"),
-               Gender = TRIM(Gender),
-               "Product_line" = TRIM("Product_line"),
-               Payment = TRIM(Payment)
-       """,
-        'fix_case_customer_type': """
-           UPDATE sales 
-           SET "Customer_type" = 
-               CASE 
-                   WHEN LOWER("Customer_type") = 'member' THEN 'Member'
-                   WHEN LOWER("Customer_type") = 'normal' THEN 'Normal'
-                   ELSE "Customer_type"
-               END
-       """,
-        'fix_case_gender': """
-           UPDATE sales 
-           SET Gender = 
-               CASE 
-                   WHEN LOWER(Gender) = 'male' THEN 'Male'
-                   WHEN LOWER(Gender) = 'female' THEN 'Female'
-                   ELSE Gender
-               END
-       """
+        'Invoice_ID': 'TRIM("Invoice_ID")',
+        'Branch': 'TRIM(Branch)',
+        'City': 'TRIM(City)',
+        'Customer_type': """
+                   CASE LOWER(TRIM("Customer_type"))
+                       WHEN 'member' THEN 'Member'
+                       WHEN 'normal' THEN 'Normal'
+                       ELSE TRIM("Customer_type")
+                   END""",
+        'Gender': """
+                   CASE LOWER(TRIM(Gender))
+                       WHEN 'male' THEN 'Male'
+                       WHEN 'female' THEN 'Female'
+                       ELSE TRIM(Gender)
+                   END""",
+        'Product_line': 'TRIM("Product_line")',
+        'Payment': 'TRIM(Payment)'
     }
+    assignments = ",\n".join(f'"{col}" = {expr}' for col, expr in corrections.items())
+    changed = "\n OR ".join(f'"{col}" IS DISTINCT FROM ({expr})' for col, expr in corrections.items())
+    query = f"""
+           UPDATE sales
+           SET {assignments}
+           WHERE {changed}
+       """
 
-    correction_counts = {}
-    for correction_name, query in corrections.items():
-        try:
-            result = conn.execute(query)
-            correction_counts[correction_name] = result.fetchone()[0]
-        except Exception as e:
-            logging.error(f"Error in correction {correction_name}: {str(e)}")
-            correction_counts[correction_name] = -1
-
-    return correction_counts
-
+    try:
+        corrected = conn.execute(query).fetchone()[0]
+    except Exception as e:
+        logging.error(f"Error in correction trim_and_fix_case: {str(e)}")
+        corrected = -1
 
-def check_column_missing(args):
-    conn, column = args
-    query = f"SELECT COUNT(*) - COUNT({column}) FROM sales"
-    result = conn.execute(query).fetchone()
-    conn.close()
-    return column, result[0] if result else 0
+    # sales no longer matches its source CSV, so make the next run reload it
+    if corrected > 0:
+        db.invalidate(conn, 'sales')
 
-def check_column_range(args):
-    db_path, column, min_val, max_val = args
-    conn = duckdb.connect(db_path, read_only=True)
-    query = f"""
-    SELECT 
-        COUNT(*) as outlier_count,
-        MIN({column}),
-        MAX({column})
-    FROM sales 
-    WHERE {column} < {min_val} OR {column} > {max_val}
-    """
-    result = conn.execute(query).fetchone()
-    conn.close()
-    return column, {
-        'outlier_count': result[0],
-        'min_value': result[1],
-        'max_value': result[2]
-    }
+    return {'trim_and_fix_case': corrected}
 
 
 def check_payment_consistency(
@@ -251,39 +280,33 @@ def check_payment_consistency(
         GROUP BY Invoice_ID
         HAVING COUNT(*) > 1
     """
-    duplicates_df = payments_conn.execute(duplicates_query).fetchdf()
-    duplicate_payments = duplicates_df.to_dict('records')
-
-
-    sales_df = sales_conn.execute("""
-        SELECT 
-            Invoice_ID,
-            Total as sales_total
-        FROM sales
-    """).fetchdf()
-
-    payments_df = payments_conn.execute("""
-        SELECT
-            Invoice_ID,
-            Total as payment_total
-        FROM payments
-    """).fetchdf()
-
-
-    merged_df = pd.merge(
-        sales_df,
-        payments_df,
-        on='Invoice_ID',
-        how='inner',  # or 'left', depending on your use-case
-        validate='many_to_many'
-    )
-
-
-    merged_df['difference'] = merged_df['sales_total'] - merged_df['payment_total']
-
-    mismatch_df = merged_df[merged_df['difference'].abs() > mismatch_threshold]
-
-    amount_mismatch = mismatch_df.to_dict('records')
+    duplicate_payments = payments_conn.execute(duplicates_query).to_arrow_table().to_pylist()
+
+
+    # Join inside DuckDB so only the mismatching rows reach Python. Attach
+    # the same database file payments_conn is reading from.
+    payments_path = payments_conn.execute("""
+        SELECT path FROM duckdb_databases() WHERE database_name = current_database()
+    """).fetchone()[0]
+    if payments_path is None:
+        raise ValueError("payments_conn must be connected to a database file, "
+                         "an in-memory database cannot be attached to sales_conn")
+    sales_conn.execute("DETACH DATABASE IF EXISTS pay")
+    escaped_path = payments_path.replace("'", "''")
+    sales_conn.execute(f"ATTACH '{escaped_path}' AS pay (READ_ONLY)")
+    try:
+        amount_mismatch = sales_conn.execute("""
+            SELECT
+                s.Invoice_ID,
+                s.Total as sales_total,
+                p.Total as payment_total,
+                s.Total - p.Total as difference
+            FROM sales s
+            JOIN pay.payments p ON s.Invoice_ID = p.Invoice_ID
+            WHERE ABS(s.Total - p.Total) > ?
+        """, [mismatch_threshold]).to_arrow_table().to_pylist()
+    finally:
+        sales_conn.execute("DETACH DATABASE pay")
 
 
     return {
@@ -297,7 +320,8 @@ def main():
     faulthandler.enable()
 
     sales_conn = db.connect_write()
-    db.reset(sales_conn,'supermarket_sales.csv','sales')
+    db.reset(sales_conn,'supermarket_sales.csv','sales',SALES_SCHEMA,SALES_DERIVED_COLUMNS,
+             date_format=SALES_DATE_FORMAT)
     payments_conn = db.connect_write_payments()
     db.reset(payments_conn,'payments.csv','payments')
     sales_conn.close()
@@ -310,6 +334,7 @@ def main():
     quality_report = checker.generate_quality_report()
     report_gen = ReportGenerator(quality_report)
     report_gen.generate_pdf_report()
+    report_gen.generate_csv_reports(conn=sales_conn, queries=checker.consistency_queries())
     report_gen.export_report_to_excel(quality_report)
 
     # Payment discrepancies